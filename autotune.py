@@ -0,0 +1,187 @@
+"""
+Sweep worker x thread combinations and recommend the fastest one.
+
+Each combination starts `workers` fresh processes, each pinned to its own
+slice of cores with `threads` intra-op threads, and every process runs the
+same number of separations of the sample file. Throughput is reported as
+jobs/hour across all workers.
+
+Example:
+    python autotune.py --workers 1,2,4 --threads 1,2,4 --jobs 3
+"""
+import os
+import json
+import time
+import queue
+import argparse
+import tempfile
+import multiprocessing as mp
+
+from cpu_tuning import apply_cpu_config, available_cpus
+
+HOME_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _int_list(value: str):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _worker(slot, workers, threads, inter_op, model, audio, jobs, start, results):
+    """Benchmark process: warm up the model, then time `jobs` separations."""
+    apply_cpu_config(
+        intra_op=threads,
+        inter_op=inter_op,
+        affinity="auto",
+        workers=workers,
+        slot=slot,
+    )
+    # Import after the thread settings are in the environment
+    from spleeter.separator import Separator
+
+    separator = Separator(model)
+    with tempfile.TemporaryDirectory() as out_dir:
+        # Warm-up run builds the graph and loads the checkpoint
+        separator.separate_to_file(audio, out_dir)
+        results.put(("ready", slot, None))
+        start.wait()
+        started = time.perf_counter()
+        for _ in range(jobs):
+            separator.separate_to_file(audio, out_dir)
+        results.put(("done", slot, time.perf_counter() - started))
+
+
+def _collect(kind, procs, results, deadline):
+    """
+    Gather one `kind` message per worker. Raises RuntimeError as soon as a
+    worker exits early, or when `deadline` passes.
+    """
+    values = []
+    while len(values) < len(procs):
+        try:
+            message, slot, value = results.get(timeout=1)
+        except queue.Empty:
+            dead = [p.exitcode for p in procs if p.exitcode not in (None, 0)]
+            if dead:
+                raise RuntimeError(f"worker exited with code {dead[0]}")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"timed out waiting for workers ({kind})")
+            continue
+        if message == kind:
+            values.append(value)
+    return values
+
+
+def run_combination(workers, threads, inter_op, model, audio, jobs, timeout):
+    """
+    Run one worker x thread combination and return its measurements.
+    A worker that dies or a phase (warm-up, timed runs) that takes longer
+    than `timeout` seconds marks the combination as failed.
+    """
+    ctx = mp.get_context("spawn")
+    start = ctx.Event()
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(
+            target=_worker,
+            args=(slot, workers, threads, inter_op, model, audio, jobs, start, results),
+            daemon=True,
+        )
+        for slot in range(workers)
+    ]
+    combination = {
+        "workers": workers,
+        "intra_op_threads": threads,
+        "inter_op_threads": inter_op,
+    }
+    for p in procs:
+        p.start()
+    try:
+        # Start the clock once every worker has finished warming up
+        _collect("ready", procs, results, time.monotonic() + timeout)
+        start.set()
+        started = time.perf_counter()
+        timings = _collect("done", procs, results, time.monotonic() + timeout)
+        wall = time.perf_counter() - started
+    except RuntimeError as e:
+        return dict(combination, failed=str(e))
+    finally:
+        for p in procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+
+    total_jobs = workers * jobs
+    return {
+        **combination,
+        "jobs": total_jobs,
+        "wall_seconds": round(wall, 2),
+        "slowest_worker_seconds": round(max(timings), 2),
+        "jobs_per_hour": round(total_jobs / wall * 3600, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Autotune separation workers and TensorFlow threads.")
+    parser.add_argument("--audio", default=os.path.join(HOME_DIR, "audio_example.mp3"))
+    parser.add_argument("--model", default="spleeter:2stems")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--threads", default="1,2,4", help="comma-separated intra-op thread counts")
+    parser.add_argument("--inter-op", type=int, default=1, help="inter-op threads per worker")
+    parser.add_argument("--jobs", type=int, default=2, help="timed separations per worker")
+    parser.add_argument("--oversubscribe", action="store_true",
+                        help="also try combinations using more threads than cores")
+    parser.add_argument("--timeout", type=float, default=1800,
+                        help="seconds allowed for warm-up and for the timed runs of each combination")
+    parser.add_argument("--output", help="write the full results as JSON to this file")
+    args = parser.parse_args()
+
+    n_cpus = len(available_cpus())
+    combos = [
+        (w, t)
+        for w in _int_list(args.workers)
+        for t in _int_list(args.threads)
+        if args.oversubscribe or w * t <= n_cpus
+    ]
+    if not combos:
+        parser.error(f"No combination fits in {n_cpus} CPUs; use --oversubscribe")
+
+    print(f"Autotuning {args.model} on {args.audio} ({n_cpus} CPUs available)")
+    results = []
+    for workers, threads in combos:
+        result = run_combination(
+            workers, threads, args.inter_op, args.model, args.audio, args.jobs, args.timeout
+        )
+        results.append(result)
+        if "failed" in result:
+            print(f"  workers={workers:<3} threads={threads:<3} failed: {result['failed']}")
+            continue
+        print(
+            f"  workers={workers:<3} threads={threads:<3} "
+            f"{result['jobs_per_hour']:>8.1f} jobs/hour  ({result['wall_seconds']}s wall)"
+        )
+
+    completed = [r for r in results if "failed" not in r]
+    if not completed:
+        print()
+        print("Every combination failed; nothing to recommend.")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({"cpus": n_cpus, "results": results, "recommended": None}, f, indent=2)
+        raise SystemExit(1)
+
+    best = max(completed, key=lambda r: r["jobs_per_hour"])
+    print()
+    print(f"Recommended: {best['workers']} workers x {best['intra_op_threads']} threads "
+          f"({best['jobs_per_hour']} jobs/hour)")
+    print(f"  WEB_CONCURRENCY={best['workers']} CPU_WORKERS={best['workers']} "
+          f"TF_INTRA_OP_THREADS={best['intra_op_threads']} "
+          f"TF_INTER_OP_THREADS={best['inter_op_threads']} CPU_AFFINITY=auto")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"cpus": n_cpus, "results": results, "recommended": best}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Offline batch separation for whole catalogs.
+
+Fans files out over a pool of worker processes that each load the model
+once. Outputs are keyed by the content hash of the source file and the model,
+so re-running over the same catalog skips everything already done, and a file
+that fails is recorded and skipped rather than stopping the run.
+
+    python bulk_separate.py /data/catalog --output /data/stems --workers 4
+    python bulk_separate.py manifest.txt --output /data/stems --model spleeter:4stems
+
+Writes <output>/<hash>/<model>/<stem>.wav and done.json per file, appends one
+line per file to <output>/bulk_progress.jsonl and writes
+<output>/bulk_summary.json.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import pathlib
+import argparse
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import models
+import wavfile
+from cpu_tuning import apply_cpu_config
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = {".mp3", ".wav", ".flac", ".ogg", ".m4a", ".aac", ".aiff", ".wma"}
+# A file in flight when a worker process dies is retried this many times
+MAX_ATTEMPTS = 2
+HASH_CHUNK = 1 << 20
+
+
+def collect_files(source: str, extensions=AUDIO_EXTENSIONS):
+    """Audio files under a directory, or the paths listed in a manifest file."""
+    source = pathlib.Path(source)
+    if source.is_dir():
+        return sorted(
+            str(p) for p in source.rglob("*")
+            if p.is_file() and p.suffix.lower() in extensions
+        )
+    files = []
+    with open(source) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            path = pathlib.Path(line)
+            files.append(str(path if path.is_absolute() else source.parent / path))
+    return files
+
+
+def content_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _init_worker(workers: int, threads: int, pin: bool, model: str):
+    """Pool initializer: apply CPU settings, then warm the model once."""
+    apply_cpu_config(
+        intra_op=threads,
+        inter_op=1 if threads else None,
+        affinity="auto" if pin else "",
+        workers=workers,
+    )
+    logging.basicConfig(level=logging.INFO)
+    with models.use_separator(model):
+        pass
+
+
+def separate_file(path: str, output_dir: str, model: str, outputs) -> dict:
+    """Separate one file unless its outputs already exist; never raises."""
+    started = time.perf_counter()
+    record = {"path": path}
+    try:
+        from spleeter.audio.adapter import AudioAdapter
+
+        record["hash"] = key = content_hash(path)
+        out_dir = pathlib.Path(output_dir) / key[:16] / model.split(":")[-1]
+        done_file = out_dir / "done.json"
+        if done_file.exists():
+            with open(done_file) as f:
+                done = json.load(f)
+            # Redo files whose earlier run wrote only some of these stems
+            if done.get("model") == model and set(outputs) <= set(done.get("outputs", [])):
+                record["status"] = "skipped"
+                return record
+            os.remove(done_file)
+
+        waveform, _ = AudioAdapter.default().load(path, sample_rate=models.SAMPLE_RATE)
+        with models.use_separator(model) as separator:
+            prediction = separator.separate(waveform)
+
+        os.makedirs(out_dir, exist_ok=True)
+        for stem in outputs:
+            wavfile.write(str(out_dir / f"{stem}.wav"), prediction[stem], models.SAMPLE_RATE)
+
+        record.update(
+            status="ok",
+            output=str(out_dir),
+            duration=round(len(waveform) / models.SAMPLE_RATE, 2),
+            seconds=round(time.perf_counter() - started, 2),
+        )
+        # Written last: its presence means every stem is complete
+        with open(done_file, "w") as f:
+            json.dump(dict(record, model=model, outputs=list(outputs)), f)
+    except Exception as e:
+        record.update(status="error", message=f"{type(e).__name__}: {e}")
+    return record
+
+
+def run(files, output_dir: str, model: str, outputs, workers: int, threads: int, pin: bool):
+    """Separate `files` over a process pool and return the summary."""
+    os.makedirs(output_dir, exist_ok=True)
+    progress_path = os.path.join(output_dir, "bulk_progress.jsonl")
+    counts = {"ok": 0, "skipped": 0, "error": 0}
+    audio_seconds = 0.0
+    started = time.perf_counter()
+
+    pending = deque(files)
+    attempts = {}
+    ctx = mp.get_context("spawn")
+    with open(progress_path, "a") as progress:
+
+        def report(record):
+            nonlocal audio_seconds
+            counts[record["status"]] += 1
+            audio_seconds += record.get("duration", 0)
+            progress.write(json.dumps(record) + "\n")
+            progress.flush()
+            done = sum(counts.values())
+            logger.info(f"[{done}/{len(files)}] {record['status']}: {record['path']}"
+                        + (f" ({record['message']})" if record["status"] == "error" else ""))
+
+        while pending:
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=ctx,
+                initializer=_init_worker,
+                initargs=(workers, threads, pin, model),
+            )
+            in_flight = {}
+            try:
+                while pending or in_flight:
+                    # Keep a short backlog per worker so a pool crash loses little
+                    while pending and len(in_flight) < workers * 2:
+                        path = pending.popleft()
+                        attempts[path] = attempts.get(path, 0) + 1
+                        in_flight[pool.submit(separate_file, path, output_dir, model, outputs)] = path
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record = future.result()
+                        in_flight.pop(future)
+                        report(record)
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory); retry what it may have held
+                logger.error("Worker process died, restarting the pool")
+                for path in in_flight.values():
+                    if attempts[path] < MAX_ATTEMPTS:
+                        pending.appendleft(path)
+                    else:
+                        report({"path": path, "status": "error", "message": "worker process died"})
+            finally:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    processed = counts["ok"] + counts["error"]
+    summary = {
+        "files": len(files),
+        **counts,
+        "model": model,
+        "workers": workers,
+        "threads_per_worker": threads,
+        "elapsed_seconds": round(elapsed, 2),
+        "files_per_hour": round(processed / elapsed * 3600, 1) if elapsed else None,
+        "audio_hours_per_hour": round(audio_seconds / elapsed, 2) if elapsed else None,
+    }
+    with open(os.path.join(output_dir, "bulk_summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Separate a directory tree or manifest of audio files.")
+    parser.add_argument("source", help="directory to scan, or a manifest with one path per line")
+    # Not under OUTPUT_BASE: that is served publicly and the records hold source paths
+    parser.add_argument("--output", required=True, help="directory for stems and progress files")
+    parser.add_argument("--model", default="spleeter:2stems", choices=sorted(models.MODEL_STEMS))
+    parser.add_argument("--outputs", help="comma-separated stems to write (default: all)")
+    parser.add_argument("--workers", type=int, default=max((os.cpu_count() or 1) // 2, 1))
+    parser.add_argument("--threads", type=int, default=0,
+                        help="intra-op threads per worker (0 = TensorFlow default)")
+    parser.add_argument("--pin", action="store_true", help="pin each worker to its own cores")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    outputs = args.outputs.split(",") if args.outputs else models.MODEL_STEMS[args.model]
+    unknown = set(outputs) - set(models.MODEL_STEMS[args.model])
+    if unknown:
+        parser.error(f"{args.model} has no stems {sorted(unknown)}")
+
+    files = collect_files(args.source)
+    logger.info(f"Separating {len(files)} files with {args.workers} workers into {args.output}")
+    summary = run(files, args.output, args.model, outputs, args.workers, args.threads, args.pin)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
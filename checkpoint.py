@@ -0,0 +1,348 @@
+"""
+Segment-level checkpoints so jobs survive restarts.
+
+Every queued job gets CHECKPOINT_DIR/<task_id>/ with:
+  job.json        the job as queued
+  progress.json   segments and frames done, owning process, heartbeat,
+                  times the job was taken over
+  lock            flock held by the process separating the job
+  <stem>.wav      PCM appended one segment at a time
+  <stem>.*.dat    waveform peaks built alongside (see peaks.py)
+
+The audio is separated SEGMENT_FRAMES samples at a time, each segment with
+CONTEXT_FRAMES of neighbouring audio on either side that is separated along
+with it and then trimmed, so STFT edges never fall on a segment boundary and
+tracks that fit in one segment are separated whole. After each segment the
+stems are flushed and progress.json is updated, so a restarted worker
+truncates the stems back to the last completed segment and carries on from
+there.
+
+A resume scan re-queues jobs whose owner is gone: a job is owned by the
+process that queued it until a worker claims it, and by that worker after.
+Jobs whose lock is held or whose owner is a live process on this host are
+left alone. Owners on other hosts count as gone once their heartbeat is
+older than STALE_SECONDS, which only applies to shared job stores; with the
+memory backend only this host's jobs from a process that has exited (a
+previous boot) are taken over. A job taken over more than MAX_ATTEMPTS
+times is marked as failed instead.
+"""
+import fcntl
+import os
+import json
+import time
+import shutil
+import logging
+import socket
+import pathlib
+import threading
+
+import models
+import peaks
+import wavfile
+from storage import OUTPUT_BASE, SHARED_DIR
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = pathlib.Path(os.environ.get("CHECKPOINT_DIR", str(SHARED_DIR / "checkpoints")))
+# Segment length in units of 512 * 1024 samples (512 STFT hops, ~11.9 s),
+# which keeps it a multiple of every peak level (see peaks.py)
+SEGMENT_BLOCKS = int(os.environ.get("CHECKPOINT_SEGMENT_BLOCKS", "10"))
+SEGMENT_FRAMES = SEGMENT_BLOCKS * 512 * 1024
+# Extra audio separated on each side of a segment and trimmed afterwards:
+# four of Spleeter's 4096-sample STFT windows
+CONTEXT_FRAMES = int(os.environ.get("CHECKPOINT_CONTEXT_FRAMES", "16384"))
+# A running job whose heartbeat is older than this is taken over
+STALE_SECONDS = float(os.environ.get("CHECKPOINT_STALE_SECONDS", "600"))
+RESUME_INTERVAL = float(os.environ.get("CHECKPOINT_RESUME_INTERVAL", "60"))
+# Takeovers allowed before a job is failed; one that keeps killing its
+# process (OOM, a crash in TensorFlow) would otherwise crash-loop the host
+MAX_ATTEMPTS = int(os.environ.get("CHECKPOINT_MAX_ATTEMPTS", "3"))
+# Host name recorded as job owner; pin it when a recreated container keeps
+# the same checkpoint volume but gets a new hostname
+OWNER_HOST = os.environ.get("CHECKPOINT_OWNER_HOST", socket.gethostname())
+
+os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+
+
+def job_dir(task_id: str) -> pathlib.Path:
+    return CHECKPOINT_DIR / task_id
+
+
+def peaks_dir(safe_basename: str) -> pathlib.Path:
+    """Published peaks and thumbnails; next to the stem folder so its zip holds only stems."""
+    return OUTPUT_BASE / f"{safe_basename}_peaks"
+
+
+def _read_json(path: pathlib.Path, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return default
+
+
+def _write_json(path: pathlib.Path, data: dict):
+    # Write then rename so a crash never leaves half a file behind
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class TaskLocked(Exception):
+    """Another process is already separating this task."""
+
+
+def _start_time(pid: int):
+    """Kernel start time of `pid`, to tell a live owner from a reused pid."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields after the parenthesised command name; starttime is field 22
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def process_owner() -> dict:
+    pid = os.getpid()
+    return {"host": OWNER_HOST, "pid": pid, "started": _start_time(pid)}
+
+
+def owner_alive(owner):
+    """True/False for an owner on this host; None when it lives on another host."""
+    if not owner:
+        return False
+    if owner.get("host") != OWNER_HOST:
+        return None
+    try:
+        os.kill(owner["pid"], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return owner.get("started") is None or _start_time(owner["pid"]) == owner["started"]
+
+
+def _try_lock(task_id: str):
+    """Non-blocking exclusive flock on the task, or None if someone holds it."""
+    fd = os.open(job_dir(task_id) / "lock", os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _unlock(fd: int):
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+
+def save_job(task_id: str, job: dict):
+    """Record a newly queued job, owned by this process until it is claimed."""
+    os.makedirs(job_dir(task_id), exist_ok=True)
+    _write_json(job_dir(task_id) / "job.json", job)
+    save_progress(task_id, {"segments": 0, "frames": 0}, None)
+
+
+def load_progress(task_id: str) -> dict:
+    return _read_json(job_dir(task_id) / "progress.json", {"segments": 0, "frames": 0})
+
+
+def save_progress(task_id: str, progress: dict, worker_id: str):
+    progress = dict(progress, worker=worker_id, owner=process_owner(), heartbeat=time.time())
+    _write_json(job_dir(task_id) / "progress.json", progress)
+    return progress
+
+
+def cleanup(task_id: str):
+    shutil.rmtree(job_dir(task_id), ignore_errors=True)
+
+
+def separate_resumable(task_id: str, job: dict, worker_id: str) -> dict:
+    """
+    Separate `job` segment by segment, picking up after the last completed
+    segment if an earlier attempt was interrupted. Returns the task result.
+    Raises TaskLocked if another process is already working on it.
+    """
+    os.makedirs(job_dir(task_id), exist_ok=True)
+    lock = _try_lock(task_id)
+    if lock is None:
+        raise TaskLocked(task_id)
+    try:
+        return _separate_locked(task_id, job, worker_id)
+    finally:
+        _unlock(lock)
+
+
+def _separate_locked(task_id: str, job: dict, worker_id: str) -> dict:
+    from spleeter.audio.adapter import AudioAdapter
+
+    file_path = job["file_path"]
+    model = job.get("model", "spleeter:2stems")
+    outputs = job.get("outputs") or models.MODEL_STEMS[model]
+    safe_basename = pathlib.Path(file_path).stem.lower()
+
+    stem_paths = {stem: job_dir(task_id) / f"{stem}.wav" for stem in outputs}
+
+    progress = load_progress(task_id)
+    if progress.get("result"):
+        return progress["result"]
+    if not all(path.exists() for path in stem_paths.values()):
+        progress = {"segments": 0, "frames": 0, "attempts": progress.get("attempts", 0)}
+    if progress["segments"]:
+        logger.info(f"Resuming {task_id} at segment {progress['segments']}")
+    progress = save_progress(task_id, progress, worker_id)
+
+    # Drop anything written after the last completed segment
+    files = {}
+    for stem, path in stem_paths.items():
+        f = open(path, "r+b" if progress["segments"] else "w+b")
+        f.truncate(wavfile.HEADER_SIZE + progress["frames"] * progress.get("channels", 0) * wavfile.SAMPLE_WIDTH)
+        f.seek(0)
+        f.write(wavfile.header(progress.get("channels", 2), models.SAMPLE_RATE, 0))
+        f.seek(0, 2)
+        files[stem] = f
+    peak_writers = {
+        stem: peaks.PeakWriter(job_dir(task_id), stem, progress["frames"], models.SAMPLE_RATE)
+        for stem in outputs
+    }
+
+    audio_adapter = AudioAdapter.default()
+    try:
+        while True:
+            # Load the segment plus context on both sides
+            lead = min(CONTEXT_FRAMES, progress["frames"])
+            waveform, _ = audio_adapter.load(
+                file_path,
+                offset=(progress["frames"] - lead) / models.SAMPLE_RATE,
+                duration=(lead + SEGMENT_FRAMES + CONTEXT_FRAMES) / models.SAMPLE_RATE,
+                sample_rate=models.SAMPLE_RATE,
+            )
+            length = min(len(waveform) - lead, SEGMENT_FRAMES)
+            if length <= 0:
+                break
+            with models.use_separator(model) as separator:
+                prediction = separator.separate(waveform)
+
+            for stem, f in files.items():
+                segment = prediction[stem][lead:lead + length]
+                f.write(wavfile.to_pcm16(segment))
+                f.flush()
+                os.fsync(f.fileno())
+                peak_writers[stem].append(segment)
+            progress["channels"] = prediction[outputs[0]].shape[1]
+            progress["frames"] += length
+            progress["segments"] += 1
+            progress = save_progress(task_id, progress, worker_id)
+            logger.info(f"Task {task_id}: segment {progress['segments']} done")
+
+            if length < SEGMENT_FRAMES:
+                break
+    finally:
+        for f in files.values():
+            f.close()
+        for writer in peak_writers.values():
+            writer.close()
+
+    # Publish the finished stems
+    out_dir = OUTPUT_BASE / safe_basename
+    for directory in (out_dir, peaks_dir(safe_basename)):
+        if directory.exists():
+            shutil.rmtree(directory)
+    os.makedirs(out_dir)
+    waveforms = {}
+    for stem, path in stem_paths.items():
+        wavfile.finalize(str(path), progress.get("channels", 2), models.SAMPLE_RATE)
+        shutil.move(str(path), str(out_dir / f"{stem}.wav"))
+        waveforms[stem] = peak_writers[stem].publish(peaks_dir(safe_basename))
+
+    result = {
+        "status": "completed",
+        "safe_basename": safe_basename,
+        "downloads": {stem: f"{safe_basename}/{stem}.wav" for stem in outputs},
+        "waveforms": waveforms,
+    }
+    save_progress(task_id, dict(progress, result=result), worker_id)
+    return result
+
+
+def _should_resume(store, info, progress, job_file) -> bool:
+    """Whether an unfinished, unlocked job has lost its owner."""
+    if store.shared and info is not None and info.get("stage") == "queued":
+        # Waiting in the shared queue; any worker can still claim it
+        return False
+    alive = owner_alive(progress.get("owner"))
+    if alive is not None:
+        return not alive
+    if not store.shared:
+        # Another host's in-memory queue holds it
+        return False
+    # Before its first heartbeat a job counts from when it was queued
+    heartbeat = progress.get("heartbeat", job_file.stat().st_mtime)
+    return time.time() - heartbeat >= STALE_SECONDS
+
+
+def resume_unfinished(store, worker_id: str):
+    """Re-queue checkpointed jobs whose owning process is gone."""
+    for job_file in sorted(CHECKPOINT_DIR.glob("*/job.json")):
+        task_id = job_file.parent.name
+        job = _read_json(job_file)
+        if job is None:
+            continue
+        lock = _try_lock(task_id)
+        if lock is None:
+            # Being separated right now
+            continue
+        try:
+            # Re-read under the lock: another scanner may have just taken it over
+            progress = load_progress(task_id)
+            info = store.get_status(task_id)
+
+            if info and info.get("status") in ("completed", "error"):
+                cleanup(task_id)
+                continue
+            if progress.get("result"):
+                # Finished, but the worker died before recording it
+                store.set_status(task_id, progress["result"])
+                cleanup(task_id)
+                continue
+            if not _should_resume(store, info, progress, job_file):
+                continue
+
+            attempts = progress.get("attempts", 0) + 1
+            if attempts > MAX_ATTEMPTS:
+                message = f"Interrupted {attempts - 1} times, giving up"
+                logger.error(f"Task {task_id}: {message}")
+                store.set_status(task_id, {"status": "error", "message": message})
+                cleanup(task_id)
+                continue
+
+            # Take ownership first so other scanners leave it alone
+            save_progress(task_id, dict(progress, attempts=attempts), worker_id)
+            store.enqueue(task_id, job)
+            logger.info(f"Re-queued unfinished task {task_id} at segment {progress['segments']} "
+                        f"(attempt {attempts} of {MAX_ATTEMPTS})")
+        finally:
+            _unlock(lock)
+
+
+def start_resumer(store, worker_id: str, stop_event: threading.Event = None) -> threading.Thread:
+    """Run `resume_unfinished` now and then every RESUME_INTERVAL seconds."""
+    stop_event = stop_event or threading.Event()
+
+    def loop():
+        while True:
+            try:
+                resume_unfinished(store, worker_id)
+            except Exception as e:
+                logger.exception(f"Resume scan failed: {e}")
+            if stop_event.wait(RESUME_INTERVAL):
+                return
+
+    thread = threading.Thread(target=loop, name="checkpoint-resumer", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,122 @@
+import os
+import fcntl
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Per-worker CPU settings, read from the environment:
+#   TF_INTRA_OP_THREADS  threads used inside a single op (0 = TensorFlow default)
+#   TF_INTER_OP_THREADS  ops run in parallel (0 = TensorFlow default)
+#   CPU_AFFINITY         "" (no pinning), "auto" (one core slice per worker),
+#                        or an explicit core list such as "0-3,8"
+#   CPU_WORKERS          number of worker processes sharing this host
+#                        (defaults to WEB_CONCURRENCY, as used by uvicorn)
+SLOT_LOCK_DIR = os.environ.get("CPU_SLOT_LOCK_DIR", "/tmp")
+
+# Keeps the slot lock open for the lifetime of the process
+_slot_lock = None
+
+
+def _int_env(name: str, default: int = 0) -> int:
+    value = os.environ.get(name, "").strip()
+    return int(value) if value else default
+
+
+def parse_cpu_list(spec: str):
+    """Turn "0-3,8" into [0, 1, 2, 3, 8]."""
+    cpus = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return sorted(set(cpus))
+
+
+def available_cpus():
+    """CPUs this process may run on."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def claim_worker_slot(workers: int) -> int:
+    """
+    Claim a free worker slot on this host with a non-blocking file lock,
+    so forked uvicorn workers each get a different index.
+    """
+    global _slot_lock
+    if _slot_lock is not None:
+        return _slot_lock[0]
+    for slot in range(workers):
+        path = os.path.join(SLOT_LOCK_DIR, f"api_sound_cpu_slot_{slot}.lock")
+        fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            continue
+        _slot_lock = (slot, fd)
+        return slot
+    # More processes than slots: share round-robin by pid
+    return os.getpid() % max(workers, 1)
+
+
+def slot_cpus(slot: int, threads: int, cpus=None):
+    """Core slice for a worker slot, wrapping around when cores run out."""
+    cpus = cpus or available_cpus()
+    threads = max(threads, 1)
+    start = (slot * threads) % len(cpus)
+    return [cpus[(start + i) % len(cpus)] for i in range(min(threads, len(cpus)))]
+
+
+def apply_cpu_config(intra_op=None, inter_op=None, affinity=None, workers=None, slot=None):
+    """
+    Apply thread-pool sizes and CPU pinning for this worker process.
+
+    Must run before TensorFlow is imported: TensorFlow reads
+    TF_NUM_INTRAOP_THREADS / TF_NUM_INTEROP_THREADS once, when its runtime
+    starts, and Spleeter's estimator sessions fall back to those values.
+    Arguments default to the environment settings described above.
+    """
+    intra_op = _int_env("TF_INTRA_OP_THREADS") if intra_op is None else intra_op
+    inter_op = _int_env("TF_INTER_OP_THREADS") if inter_op is None else inter_op
+    affinity = os.environ.get("CPU_AFFINITY", "").strip() if affinity is None else affinity
+    if workers is None:
+        workers = _int_env("CPU_WORKERS", _int_env("WEB_CONCURRENCY", 1))
+
+    if intra_op > 0:
+        os.environ["TF_NUM_INTRAOP_THREADS"] = str(intra_op)
+        os.environ["OMP_NUM_THREADS"] = str(intra_op)
+    if inter_op > 0:
+        os.environ["TF_NUM_INTEROP_THREADS"] = str(inter_op)
+
+    pinned = None
+    if affinity == "auto":
+        if slot is None:
+            slot = claim_worker_slot(workers)
+        threads = intra_op or max(len(available_cpus()) // max(workers, 1), 1)
+        pinned = slot_cpus(slot, threads)
+    elif affinity:
+        pinned = parse_cpu_list(affinity)
+
+    if pinned:
+        try:
+            os.sched_setaffinity(0, pinned)
+        except (AttributeError, OSError) as e:
+            logger.warning(f"CPU pinning to {pinned} failed: {e}")
+            pinned = None
+
+    config = {
+        "intra_op_threads": intra_op,
+        "inter_op_threads": inter_op,
+        "cpus": pinned,
+        "slot": slot,
+    }
+    logger.info(f"CPU config (pid {os.getpid()}): {config}")
+    return config
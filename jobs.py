@@ -0,0 +1,236 @@
+"""
+Job queue and task status shared between API replicas and workers.
+
+Jobs are handed out lowest `sort_key` first (see scheduler.py).
+
+Backends, selected with JOB_BACKEND:
+  memory  in-process only; the default single-container mode
+  sqlite  a SQLite file on a shared volume (JOB_DB); fine locally or on one host
+  redis   a Redis server (REDIS_URL); needs the `redis` package
+"""
+import os
+import json
+import time
+import queue
+import itertools
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+from storage import SHARED_DIR
+
+logger = logging.getLogger(__name__)
+
+JOB_BACKEND = os.environ.get("JOB_BACKEND", "memory").lower()
+JOB_DB = os.environ.get("JOB_DB", str(SHARED_DIR / "jobs.sqlite3"))
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+REDIS_PREFIX = os.environ.get("REDIS_PREFIX", "api_sound")
+
+# How often workers poll backends that cannot block
+POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1.0"))
+
+
+class MemoryJobStore:
+    """Queue and status dict living in this process."""
+
+    # Other processes cannot see or claim these jobs
+    shared = False
+
+    def __init__(self):
+        self._queue = queue.PriorityQueue()
+        # Tie-breaker so equal keys keep arrival order
+        self._seq = itertools.count()
+        self._jobs = {}
+        self._status = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, task_id: str, job: dict):
+        with self._lock:
+            self._jobs[task_id] = job
+            self._status[task_id] = {"status": "processing", "stage": "queued"}
+        self._queue.put((job["sort_key"], next(self._seq), task_id))
+
+    def claim(self, worker_id: str, timeout: float = POLL_INTERVAL):
+        """Take the next queued job, or return None after `timeout` seconds."""
+        try:
+            _, _, task_id = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            self._status[task_id] = {"status": "processing", "stage": "separating", "worker": worker_id}
+            return task_id, self._jobs[task_id]
+
+    def set_status(self, task_id: str, info: dict):
+        with self._lock:
+            self._status[task_id] = info
+            if info.get("status") in ("completed", "error"):
+                self._jobs.pop(task_id, None)
+
+    def get_status(self, task_id: str):
+        with self._lock:
+            return self._status.get(task_id)
+
+
+class SQLiteJobStore:
+    """Queue and status in a SQLite file that all replicas can open."""
+
+    shared = True
+
+    def __init__(self, path: str = JOB_DB):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    task_id TEXT PRIMARY KEY,
+                    job TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    sort_key REAL NOT NULL,
+                    claimed_by TEXT,
+                    claimed_at REAL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (state, sort_key)")
+
+    @contextmanager
+    def _connect(self):
+        # Default rollback journal: WAL does not work across hosts on a network share
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, task_id: str, job: dict):
+        status = {"status": "processing", "stage": "queued"}
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (task_id, job, status, state, enqueued_at, sort_key) "
+                "VALUES (?, ?, ?, 'queued', ?, ?)",
+                (task_id, json.dumps(job), json.dumps(status), time.time(), job["sort_key"]),
+            )
+
+    def claim(self, worker_id: str, timeout: float = POLL_INTERVAL):
+        """Atomically move the first queued job to running, or return None."""
+        with self._connect() as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT task_id, job FROM jobs WHERE state = 'queued' ORDER BY sort_key LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    task_id, job = row
+                    status = {"status": "processing", "stage": "separating", "worker": worker_id}
+                    conn.execute(
+                        "UPDATE jobs SET state = 'running', status = ?, claimed_by = ?, claimed_at = ? "
+                        "WHERE task_id = ?",
+                        (json.dumps(status), worker_id, time.time(), task_id),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                # BEGIN IMMEDIATE itself may have failed (database is locked)
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            time.sleep(timeout)
+            return None
+        return task_id, json.loads(job)
+
+    def set_status(self, task_id: str, info: dict):
+        state = "done" if info.get("status") in ("completed", "error") else "running"
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, state = ? WHERE task_id = ?",
+                (json.dumps(info), state, task_id),
+            )
+
+    def get_status(self, task_id: str):
+        with self._connect() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE task_id = ?", (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+# Pop the lowest-scored task and mark it claimed in one step, so a worker
+# dying in between cannot leave a task out of the queue but still "queued"
+_REDIS_CLAIM = """
+local item = redis.call('ZPOPMIN', KEYS[1])
+if #item == 0 then
+    return false
+end
+local key = ARGV[1] .. item[1]
+local job = redis.call('HGET', key, 'job')
+if not job then
+    return false
+end
+redis.call('HSET', key, 'status', ARGV[2])
+return {item[1], job}
+"""
+
+
+class RedisJobStore:
+    """Queue as a Redis sorted set, job and status as one hash per task."""
+
+    shared = True
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = REDIS_PREFIX):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("JOB_BACKEND=redis needs the `redis` package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.queue_key = f"{prefix}:queue"
+        self._claim = self.client.register_script(_REDIS_CLAIM)
+
+    def _key(self, task_id: str) -> str:
+        return f"{self.prefix}:job:{task_id}"
+
+    def enqueue(self, task_id: str, job: dict):
+        status = {"status": "processing", "stage": "queued"}
+        pipe = self.client.pipeline()
+        pipe.hset(self._key(task_id), mapping={"job": json.dumps(job), "status": json.dumps(status)})
+        pipe.zadd(self.queue_key, {task_id: job["sort_key"]})
+        pipe.execute()
+
+    def claim(self, worker_id: str, timeout: float = POLL_INTERVAL):
+        """Atomically pop the first queued job and mark it running, or return None."""
+        status = {"status": "processing", "stage": "separating", "worker": worker_id}
+        # Scripts cannot block, so poll like the SQLite store
+        claimed = self._claim(keys=[self.queue_key], args=[self._key(""), json.dumps(status)])
+        if not claimed:
+            time.sleep(timeout)
+            return None
+        task_id, job = claimed
+        return task_id.decode(), json.loads(job)
+
+    def set_status(self, task_id: str, info: dict):
+        self.client.hset(self._key(task_id), "status", json.dumps(info))
+
+    def get_status(self, task_id: str):
+        raw = self.client.hget(self._key(task_id), "status")
+        return json.loads(raw) if raw else None
+
+
+BACKENDS = {
+    "memory": MemoryJobStore,
+    "sqlite": SQLiteJobStore,
+    "redis": RedisJobStore,
+}
+
+_store = None
+
+
+def get_job_store():
+    """The process-wide job store for JOB_BACKEND."""
+    global _store
+    if _store is None:
+        if JOB_BACKEND not in BACKENDS:
+            raise RuntimeError(f"Unknown JOB_BACKEND {JOB_BACKEND!r}; use one of {sorted(BACKENDS)}")
+        _store = BACKENDS[JOB_BACKEND]()
+        logger.info(f"Using {JOB_BACKEND} job store")
+    return _store
@@ -1,22 +1,40 @@
+# Imported first so cold-start timing covers the rest of the boot
+import models
+
 import os
+import time
 import uuid
 import shutil
 import logging
-import pathlib
+from typing import Dict, Optional
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Request, status
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel
+
+from cpu_tuning import apply_cpu_config
+
+# Thread pools and pinning must be set before TensorFlow loads;
+# Spleeter and TensorFlow themselves are imported lazily by `models`
+CPU_CONFIG = apply_cpu_config()
 
-from spleeter.separator import Separator
+import checkpoint
+import peaks
+import remix
+from jobs import get_job_store
+from scheduler import PRIORITY_OFFSETS, schedule
+from storage import OUTPUT_BASE, UPLOAD_DIR
+from worker import start_workers, worker_id
 
-# Paths
-HOME_DIR = pathlib.Path(__file__).parent.resolve()
-OUTPUT_BASE = HOME_DIR / "output"
+# Separation loops run inside the API process; set to 0 on API-only
+# replicas when standalone workers (worker.py) serve the shared queue
+EMBEDDED_WORKERS = int(os.environ.get("EMBEDDED_WORKERS", "1"))
 
-# Ensure that the output directory exists before mounting
-os.makedirs(OUTPUT_BASE, exist_ok=True)
+# Peaks and thumbnails never change once a task completes
+WAVEFORM_CACHE_SECONDS = int(os.environ.get("WAVEFORM_CACHE_SECONDS", "86400"))
 
 # FastAPI app
 app = FastAPI()
@@ -40,87 +58,92 @@ app.mount(
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# In-memory task status
-processing_status = {}
-
-def process_audio_background(file_path: str, task_id: str):
-    """Run Spleeter and organize outputs, then clean up the upload."""
-    try:
-        basename = pathlib.Path(file_path).stem
-        safe_basename = basename.lower()
-        out_dir = OUTPUT_BASE / safe_basename
-
-        # Separate stems
-        separator = Separator("spleeter:2stems")
-        separator.separate_to_file(file_path, str(OUTPUT_BASE))
-
-        # After separation, Spleeter creates a folder named `basename`
-        orig_dir = OUTPUT_BASE / basename
-        if orig_dir.exists() and orig_dir != out_dir:
-            if out_dir.exists():
-                shutil.rmtree(out_dir)
-            orig_dir.rename(out_dir)
-            logger.info(f"Renamed {orig_dir} → {out_dir}")
-
-        # Mark complete
-        processing_status[task_id] = {
-            "status": "completed",
-            "safe_basename": safe_basename,
-            "downloads": {
-                "vocals": f"{safe_basename}/vocals.wav",
-                "accompaniment": f"{safe_basename}/accompaniment.wav",
-            },
-        }
-        logger.info(f"Task {task_id} completed")
+# Task queue and status, shared with workers on other replicas
+job_store = get_job_store()
+if not job_store.shared and EMBEDDED_WORKERS <= 0:
+    # Nothing else can see an in-process queue; jobs would wait forever
+    raise RuntimeError("JOB_BACKEND=memory needs EMBEDDED_WORKERS > 0; use sqlite or redis for API-only replicas")
 
-        # Clean up original upload
-        try:
-            os.remove(file_path)
-            logger.info(f"Removed upload: {file_path}")
-        except Exception as e:
-            logger.error(f"Cleanup error for {file_path}: {e}")
 
-    except Exception as e:
-        logger.exception(f"Background processing failed ({task_id}): {e}")
-        processing_status[task_id] = {"status": "error", "message": str(e)}
+@app.on_event("startup")
+def preload_models():
+    """Start background model loading, workers and the resume scan; startup stays fast."""
+    if EMBEDDED_WORKERS > 0:
+        models.start_preload()
+        start_workers(EMBEDDED_WORKERS)
+    else:
+        # API-only replica: nothing to load, ready as soon as it serves
+        models.start_preload([])
+    # Pick up jobs interrupted by a restart
+    checkpoint.start_resumer(job_store, worker_id())
 
 
 @app.post("/process-audio/")
 async def process_audio(
     request: Request,
-    background_tasks: BackgroundTasks,
     audio_file: UploadFile = File(...),
+    stems: str = Form("2stems"),
+    outputs: Optional[str] = Form(None),
+    priority: str = Form("normal"),
 ):
     """
-    Save the uploaded file, kick off Spleeter in the background,
+    Save the uploaded file, queue it for separation,
     and return task info with download URLs.
+
+    Form parameters:
+      - stems: "2stems", "4stems" or "5stems"
+      - outputs: comma-separated stems to keep (default: all of them)
+      - priority: "high", "normal" or "low"
     """
+    model = f"spleeter:{stems}"
+    if model not in models.MODEL_STEMS:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Unknown stems option: {stems}")
+    wanted = [o.strip() for o in outputs.split(",") if o.strip()] if outputs else models.MODEL_STEMS[model]
+    unknown = set(wanted) - set(models.MODEL_STEMS[model])
+    if unknown or not wanted:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Invalid outputs for {stems}: {outputs}")
+    if priority not in PRIORITY_OFFSETS:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Unknown priority: {priority}")
+
     try:
         # Save upload to disk
-        upload_path = HOME_DIR / audio_file.filename
+        upload_path = UPLOAD_DIR / audio_file.filename
         with open(upload_path, "wb") as f:
             f.write(await audio_file.read())
         logger.info(f"Saved upload to {upload_path}")
 
-        # Initialize task
+        # Estimate cost from the probed duration, then queue the job;
+        # any worker on any node may pick it up
         task_id = str(uuid.uuid4())
-        processing_status[task_id] = {"status": "processing"}
-
-        # Launch background processing
-        background_tasks.add_task(process_audio_background, str(upload_path), task_id)
+        job = {
+            "file_path": str(upload_path),
+            "model": model,
+            "outputs": wanted,
+            "priority": priority,
+        }
+        job = await run_in_threadpool(schedule, job, time.time())
+        # Checkpoint first: a worker may claim the job as soon as it is queued
+        checkpoint.save_job(task_id, job)
+        try:
+            job_store.enqueue(task_id, job)
+        except Exception:
+            checkpoint.cleanup(task_id)
+            raise
 
         # Build URLs (they'll be valid once processing completes)
         status_url = request.url_for("get_status", task_id=task_id)
+        safe_basename = audio_file.filename.rsplit('.', 1)[0].lower()
         downloads = {
-            "vocals": request.url_for("output_files", path=f"{audio_file.filename.rsplit('.',1)[0].lower()}/vocals.wav"),
-            "accompaniment": request.url_for("output_files", path=f"{audio_file.filename.rsplit('.',1)[0].lower()}/accompaniment.wav"),
-            "all": request.url_for("download_all", task_id=task_id),
+            stem: request.url_for("output_files", path=f"{safe_basename}/{stem}.wav")
+            for stem in wanted
         }
+        downloads["all"] = request.url_for("download_all", task_id=task_id)
 
         return {
             "message": "Processing started",
             "task_id": task_id,
             "status_url": status_url,
+            "estimated_cost": job["estimated_cost"],
             "downloads": downloads,
         }
 
@@ -132,22 +155,28 @@ async def process_audio(
 @app.get("/status/{task_id}")
 def get_status(task_id: str):
     """Check background-job status."""
-    info = processing_status.get(task_id)
+    info = job_store.get_status(task_id)
     if not info:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Task not found")
     return info
 
 
-@app.get("/download/{task_id}/all")
-def download_all(task_id: str):
-    """
-    Zip up both stems for a completed task and return a single download.
-    """
-    info = processing_status.get(task_id)
+def completed_task(task_id: str) -> dict:
+    """Status of a completed task, or the matching HTTP error."""
+    info = job_store.get_status(task_id)
     if not info:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Task not found")
     if info.get("status") != "completed":
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Task not completed yet")
+    return info
+
+
+@app.get("/download/{task_id}/all")
+def download_all(task_id: str):
+    """
+    Zip up all stems for a completed task and return a single download.
+    """
+    info = completed_task(task_id)
 
     safe_basename = info["safe_basename"]
     stem_dir = OUTPUT_BASE / safe_basename
@@ -169,11 +198,102 @@ def download_all(task_id: str):
     )
 
 
+@app.get("/waveform/{task_id}/{stem}")
+def get_waveform(task_id: str, stem: str, samples_per_pixel: int = 1024, format: str = "dat"):
+    """
+    Precomputed min/max peaks for one stem, at one of the PEAK_LEVELS zoom levels.
+    `format=dat` returns audiowaveform binary data, `format=json` the same as JSON.
+    """
+    info = completed_task(task_id)
+    levels = info.get("waveforms", {}).get(stem, {}).get("peaks", {})
+    name = levels.get(str(samples_per_pixel))
+    if name is None:
+        raise HTTPException(
+            status.HTTP_404_NOT_FOUND,
+            f"No peaks for {stem} at {samples_per_pixel} samples per pixel; available: {sorted(levels, key=int)}",
+        )
+    path = checkpoint.peaks_dir(info["safe_basename"]) / name
+    if not path.exists():
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Output files missing")
+
+    headers = {"Cache-Control": f"public, max-age={WAVEFORM_CACHE_SECONDS}"}
+    if format == "json":
+        return JSONResponse(content=peaks.dat_to_json(str(path)), headers=headers)
+    return FileResponse(path=str(path), media_type="application/octet-stream", headers=headers)
+
+
+@app.get("/spectrogram/{task_id}/{stem}")
+def get_spectrogram(task_id: str, stem: str):
+    """Small spectrogram thumbnail (PNG) for one stem."""
+    info = completed_task(task_id)
+    name = info.get("waveforms", {}).get(stem, {}).get("spectrogram")
+    path = checkpoint.peaks_dir(info["safe_basename"]) / name if name else None
+    if path is None or not path.exists():
+        raise HTTPException(status.HTTP_404_NOT_FOUND, f"No spectrogram for {stem}")
+    return FileResponse(
+        path=str(path),
+        media_type="image/png",
+        headers={"Cache-Control": f"public, max-age={WAVEFORM_CACHE_SECONDS}"},
+    )
+
+
+class RemixRequest(BaseModel):
+    # dB per stem (at most remix.MAX_GAIN_DB); null mutes it, stems left out play at 0 dB
+    gains: Dict[str, Optional[float]] = {}
+    format: str = "wav"
+
+
+@app.post("/remix/{task_id}")
+def remix_task(task_id: str, body: RemixRequest):
+    """
+    Mix a completed task's stems with per-stem gains and stream back one file,
+    e.g. {"gains": {"vocals": -6, "drums": null}, "format": "mp3"}.
+    """
+    info = completed_task(task_id)
+    stems = info.get("downloads", {})
+    unknown = set(body.gains) - set(stems)
+    if unknown:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Unknown stems: {sorted(unknown)}")
+    if body.format not in remix.FORMATS:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Format must be one of {sorted(remix.FORMATS)}")
+    too_loud = sorted(
+        stem for stem, db in body.gains.items() if db is not None and not db <= remix.MAX_GAIN_DB
+    )
+    if too_loud:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST, f"Gains must be at most {remix.MAX_GAIN_DB:g} dB: {too_loud}"
+        )
+
+    stem_paths = {stem: OUTPUT_BASE / rel_path for stem, rel_path in stems.items()}
+    if not all(path.exists() for path in stem_paths.values()):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Output files missing")
+
+    try:
+        stream = remix.render(stem_paths, body.gains, body.format)
+    except ValueError as e:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(e))
+
+    filename = f"{info['safe_basename']}_remix.{body.format}"
+    return StreamingResponse(
+        stream,
+        media_type=remix.FORMATS[body.format][0],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @app.get("/ping")
 def ping():
     return {"status": "alive"}
 
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once every preloaded model can serve, 503 before."""
+    info = models.readiness()
+    code = status.HTTP_200_OK if info["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE
+    return JSONResponse(status_code=code, content=info)
+
+
 if __name__ == "__main__":
     import uvicorn
 
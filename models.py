@@ -0,0 +1,152 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Models warmed up at startup, e.g. "spleeter:2stems,spleeter:4stems"
+PRELOAD_MODELS = [
+    m.strip()
+    for m in os.environ.get("PRELOAD_MODELS", "spleeter:2stems").split(",")
+    if m.strip()
+]
+
+# A failed preload (e.g. the pretrained model download) is retried after this
+# many seconds, doubling up to PRELOAD_RETRY_MAX
+PRELOAD_RETRY_SECONDS = float(os.environ.get("PRELOAD_RETRY_SECONDS", "30"))
+PRELOAD_RETRY_MAX = float(os.environ.get("PRELOAD_RETRY_MAX", "600"))
+
+# Stems each model produces, in Spleeter's order
+MODEL_STEMS = {
+    "spleeter:2stems": ["vocals", "accompaniment"],
+    "spleeter:4stems": ["vocals", "drums", "bass", "other"],
+    "spleeter:5stems": ["vocals", "drums", "bass", "piano", "other"],
+}
+
+# Spleeter's models are trained on 44.1 kHz audio
+SAMPLE_RATE = 44100
+
+# main.py imports this module first, so cold start covers the whole boot
+STARTED_AT = time.monotonic()
+
+_registry_lock = threading.Lock()
+# model name -> {"status", "separator", "lock", "load_seconds", "error"}
+_models = {}
+_preloading = list(PRELOAD_MODELS)
+_ready_at = None
+
+
+def _entry(model: str) -> dict:
+    with _registry_lock:
+        if model not in _models:
+            _models[model] = {
+                "status": "pending",
+                "separator": None,
+                "lock": threading.Lock(),
+                "load_seconds": None,
+                "error": None,
+            }
+        return _models[model]
+
+
+def _load(model: str, entry: dict):
+    """Import the ML stack on first use, build the model and run one warm-up pass."""
+    entry["status"] = "loading"
+    started = time.monotonic()
+    try:
+        import numpy as np
+        from spleeter.separator import Separator
+
+        separator = Separator(model)
+        # Builds the graph and restores the checkpoint on one second of silence
+        separator.separate(np.zeros((SAMPLE_RATE, 2), dtype=np.float32))
+    except Exception as e:
+        entry["status"] = "error"
+        entry["error"] = str(e)
+        logger.exception(f"Loading {model} failed: {e}")
+        raise
+    entry["separator"] = separator
+    entry["load_seconds"] = round(time.monotonic() - started, 2)
+    entry["status"] = "ready"
+    entry["error"] = None
+    logger.info(f"Model {model} ready in {entry['load_seconds']}s")
+    _check_ready()
+
+
+def _check_ready():
+    """Record the cold-start time once every preloaded model is ready."""
+    global _ready_at
+    if _ready_at is None and all(_entry(m)["status"] == "ready" for m in _preloading):
+        _ready_at = time.monotonic()
+        logger.info(f"Service ready, cold start took {round(_ready_at - STARTED_AT, 2)}s")
+
+
+@contextmanager
+def use_separator(model: str):
+    """
+    Yield a warm Separator for `model`, loading it on first use.
+    Calls are serialised per model since a Separator's predictor is not
+    safe to share between threads.
+    """
+    entry = _entry(model)
+    with entry["lock"]:
+        if entry["separator"] is None:
+            _load(model, entry)
+        yield entry["separator"]
+
+
+def preload(models=None):
+    """
+    Load every configured model, retrying failures with backoff until all
+    are ready; meant to run in a background thread.
+    """
+    global _preloading
+    models = PRELOAD_MODELS if models is None else models
+    _preloading = list(models)
+    delay = PRELOAD_RETRY_SECONDS
+    while True:
+        for model in models:
+            try:
+                with use_separator(model):
+                    pass
+            except Exception:
+                continue
+        _check_ready()
+        failed = [m for m in models if _entry(m)["status"] != "ready"]
+        if not failed:
+            return
+        logger.warning(f"Preloading {failed} failed, retrying in {delay}s")
+        time.sleep(delay)
+        delay = min(delay * 2, PRELOAD_RETRY_MAX)
+
+
+def start_preload(models=None) -> threading.Thread:
+    thread = threading.Thread(target=preload, args=(models,), name="model-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def readiness() -> dict:
+    """
+    Load state of every preloaded or on-demand model, plus the measured
+    cold-start time. Ready means every preloaded model is loaded right now.
+    """
+    with _registry_lock:
+        loaded = [model for model in _models if model not in _preloading]
+    models = {
+        model: {
+            "status": _entry(model)["status"],
+            "preloaded": model in _preloading,
+            "load_seconds": _entry(model)["load_seconds"],
+            "error": _entry(model)["error"],
+        }
+        for model in list(_preloading) + loaded
+    }
+    return {
+        "ready": all(info["status"] == "ready" for info in models.values() if info["preloaded"]),
+        "uptime_seconds": round(time.monotonic() - STARTED_AT, 2),
+        "cold_start_seconds": round(_ready_at - STARTED_AT, 2) if _ready_at else None,
+        "models": models,
+    }
@@ -0,0 +1,184 @@
+"""
+Waveform peaks and spectrogram thumbnails for finished stems.
+
+Peaks are min/max pairs per PEAK_LEVELS samples in the audiowaveform ".dat"
+(version 1, 8-bit) format that peaks.js and similar players read directly.
+Both are built segment by segment from the arrays the separator returns, and
+appended to files next to the checkpointed stems so they resume with them.
+Peak levels and SPECTROGRAM_HOP must be powers of two so they divide the
+checkpoint segment length.
+"""
+import os
+import zlib
+import struct
+
+import numpy as np
+
+PEAK_LEVELS = [
+    int(level)
+    for level in os.environ.get("PEAK_LEVELS", "256,1024,4096").split(",")
+    if level.strip()
+]
+SPECTROGRAM = os.environ.get("SPECTROGRAM_THUMBNAILS", "1") == "1"
+SPECTROGRAM_HOP = 16384
+SPECTROGRAM_FFT = 2048
+SPECTROGRAM_WIDTH = int(os.environ.get("SPECTROGRAM_WIDTH", "512"))
+SPECTROGRAM_HEIGHT = int(os.environ.get("SPECTROGRAM_HEIGHT", "128"))
+
+DAT_HEADER_SIZE = 20
+# flags bit 0 set: 8-bit samples
+DAT_FLAGS_8BIT = 1
+
+
+def dat_header(sample_rate: int, samples_per_pixel: int, length: int) -> bytes:
+    return struct.pack("<iIiiI", 1, DAT_FLAGS_8BIT, sample_rate, samples_per_pixel, length)
+
+
+def compute_peaks(data, samples_per_pixel: int):
+    """(n, 2) int8 min/max per `samples_per_pixel` frames, across all channels."""
+    frames, channels = data.shape
+    full = frames // samples_per_pixel
+    if full:
+        blocks = np.ascontiguousarray(data[:full * samples_per_pixel]).reshape(full, -1)
+        mins, maxs = blocks.min(axis=1), blocks.max(axis=1)
+    else:
+        # Shorter than one block: only the tail peak below
+        mins = maxs = np.empty(0, dtype=data.dtype)
+    if frames % samples_per_pixel:
+        # Partial block at the end of the stem
+        tail = data[full * samples_per_pixel:]
+        mins, maxs = np.append(mins, tail.min()), np.append(maxs, tail.max())
+    peaks = np.stack([mins, maxs], axis=1)
+    return np.round(np.clip(peaks, -1.0, 1.0) * 127).astype(np.int8)
+
+
+def _band_edges(sample_rate: int):
+    """First FFT bin of each of SPECTROGRAM_HEIGHT log-spaced bands, 40 Hz to Nyquist."""
+    bins = SPECTROGRAM_FFT // 2 + 1
+    freqs = np.geomspace(40, sample_rate / 2, SPECTROGRAM_HEIGHT + 1)[:-1]
+    # Repeated edges at the low end are fine: reduceat then takes that single bin
+    return np.round(freqs / (sample_rate / 2) * (bins - 1)).astype(int)
+
+
+def spectrogram_columns(data, sample_rate: int):
+    """(columns, bands) float16 log-magnitude, one column per SPECTROGRAM_HOP frames."""
+    mono = data.mean(axis=1)
+    starts = np.arange(0, len(mono), SPECTROGRAM_HOP)
+    padded = np.pad(mono, (0, SPECTROGRAM_FFT))
+    index = starts[:, None] + np.arange(SPECTROGRAM_FFT)[None, :]
+    magnitude = np.abs(np.fft.rfft(padded[index] * np.hanning(SPECTROGRAM_FFT), axis=1))
+    bands = np.maximum.reduceat(magnitude, _band_edges(sample_rate), axis=1)
+    return (20 * np.log10(bands + 1e-6)).astype(np.float16)
+
+
+def png(image) -> bytes:
+    """Encode a (height, width) uint8 array as a grayscale PNG."""
+    height, width = image.shape
+
+    def chunk(kind, body):
+        return (struct.pack(">I", len(body)) + kind + body
+                + struct.pack(">I", zlib.crc32(kind + body) & 0xFFFFFFFF))
+
+    # Each scanline starts with filter type 0
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), image]).tobytes()
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw, 9))
+        + chunk(b"IEND", b"")
+    )
+
+
+def render_spectrogram(columns):
+    """Scale stored columns to a SPECTROGRAM_WIDTH x SPECTROGRAM_HEIGHT image."""
+    columns = columns.astype(np.float32)
+    if len(columns) == 0:
+        columns = np.full((1, SPECTROGRAM_HEIGHT), -120, dtype=np.float32)
+    # Loudest column per output pixel; short stems repeat columns instead
+    edges = np.linspace(0, len(columns), SPECTROGRAM_WIDTH + 1).astype(int)[:-1]
+    resized = np.maximum.reduceat(columns, edges, axis=0)
+    top = resized.max()
+    scaled = np.clip((resized - (top - 80)) / 80, 0, 1)
+    # Low frequencies at the bottom
+    return png((scaled.T[::-1] * 255).astype(np.uint8))
+
+
+class PeakWriter:
+    """
+    Appends peaks and spectrogram columns for one stem, segment by segment.
+    Opening with `frames` done truncates anything written past that point.
+    """
+
+    def __init__(self, directory, stem: str, frames: int, sample_rate: int):
+        self.stem = stem
+        self.sample_rate = sample_rate
+        self.paths = {level: os.path.join(directory, f"{stem}.{level}.dat") for level in PEAK_LEVELS}
+        self.spectrogram_path = os.path.join(directory, f"{stem}.spectrogram.f16")
+        self.files = {}
+        for level, path in self.paths.items():
+            self.files[level] = self._open(path, DAT_HEADER_SIZE + frames // level * 2, frames)
+        if SPECTROGRAM:
+            bands_size = SPECTROGRAM_HEIGHT * 2
+            self.files["spectrogram"] = self._open(
+                self.spectrogram_path, frames // SPECTROGRAM_HOP * bands_size, frames
+            )
+
+    @staticmethod
+    def _open(path: str, size: int, frames: int):
+        # .dat files keep a zeroed header until `publish`
+        f = open(path, "r+b" if frames and os.path.exists(path) else "w+b")
+        f.truncate(size)
+        f.seek(0, 2)
+        return f
+
+    def append(self, data):
+        for level in PEAK_LEVELS:
+            f = self.files[level]
+            f.write(compute_peaks(data, level).tobytes())
+            f.flush()
+        if SPECTROGRAM:
+            f = self.files["spectrogram"]
+            f.write(spectrogram_columns(data, self.sample_rate).tobytes())
+            f.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    def publish(self, out_dir) -> dict:
+        """Write final .dat files (and PNG) into `out_dir`; return their names."""
+        os.makedirs(out_dir, exist_ok=True)
+        written = {"peaks": {}}
+        for level, path in self.paths.items():
+            with open(path, "rb") as f:
+                body = f.read()[DAT_HEADER_SIZE:]
+            name = f"{self.stem}.{level}.dat"
+            with open(os.path.join(out_dir, name), "wb") as f:
+                f.write(dat_header(self.sample_rate, level, len(body) // 2))
+                f.write(body)
+            written["peaks"][str(level)] = name
+        if SPECTROGRAM:
+            columns = np.fromfile(self.spectrogram_path, dtype=np.float16).reshape(-1, SPECTROGRAM_HEIGHT)
+            name = f"{self.stem}.png"
+            with open(os.path.join(out_dir, name), "wb") as f:
+                f.write(render_spectrogram(columns))
+            written["spectrogram"] = name
+        return written
+
+
+def dat_to_json(path: str) -> dict:
+    """The audiowaveform JSON form of a .dat file, for clients without a .dat reader."""
+    with open(path, "rb") as f:
+        version, flags, sample_rate, samples_per_pixel, length = struct.unpack(
+            "<iIiiI", f.read(DAT_HEADER_SIZE)
+        )
+        data = np.frombuffer(f.read(), dtype=np.int8 if flags & DAT_FLAGS_8BIT else "<i2")
+    return {
+        "version": version,
+        "channels": 1,
+        "sample_rate": sample_rate,
+        "samples_per_pixel": samples_per_pixel,
+        "bits": 8 if flags & DAT_FLAGS_8BIT else 16,
+        "length": length,
+        "data": data.tolist(),
+    }
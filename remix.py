@@ -0,0 +1,146 @@
+"""
+Server-side mixing of stored stems with per-stem gains.
+
+Stems are memory-mapped and mixed one chunk at a time, so memory use stays
+at a few chunk buffers whatever the track length. WAV output is produced
+directly; other formats are encoded by piping the PCM through ffmpeg.
+"""
+import os
+import wave
+import logging
+import threading
+import subprocess
+
+import numpy as np
+
+import wavfile
+
+logger = logging.getLogger(__name__)
+
+# Frames mixed per step (~1.5 s at 44.1 kHz)
+CHUNK_FRAMES = int(os.environ.get("REMIX_CHUNK_FRAMES", "65536"))
+
+# Loudest gain accepted per stem
+MAX_GAIN_DB = 24.0
+
+# format -> (media type, ffmpeg output arguments; None = written directly)
+FORMATS = {
+    "wav": ("audio/wav", None),
+    "mp3": ("audio/mpeg", ["-f", "mp3", "-b:a", "192k"]),
+    "flac": ("audio/flac", ["-f", "flac"]),
+    "ogg": ("audio/ogg", ["-f", "ogg", "-c:a", "libvorbis", "-q:a", "5"]),
+}
+
+
+def open_stem(path: str):
+    """Memory-map a 16-bit PCM WAV as a (frames, channels) int16 array."""
+    with open(path, "rb") as f:
+        with wave.open(f) as w:
+            if w.getsampwidth() != wavfile.SAMPLE_WIDTH:
+                raise ValueError(f"{path} is not 16-bit PCM")
+            channels, sample_rate, frames = w.getnchannels(), w.getframerate(), w.getnframes()
+            # wave stops right after the data chunk header
+            offset = f.tell()
+    data = np.memmap(path, dtype="<i2", mode="r", offset=offset, shape=(frames, channels))
+    return data, sample_rate
+
+
+def db_to_gain(db):
+    """Linear gain for a dB value; None mutes."""
+    if db is None:
+        return 0.0
+    # Also rejects NaN
+    if not db <= MAX_GAIN_DB:
+        raise ValueError(f"Gain {db} dB is above the {MAX_GAIN_DB:g} dB limit")
+    return float(10 ** (db / 20))
+
+
+def mix_pcm(stems):
+    """
+    Yield mixed 16-bit PCM bytes for `stems`, a list of (memmap, gain) pairs
+    sharing a sample rate and channel count.
+    """
+    frames = min(len(data) for data, _ in stems)
+    channels = stems[0][0].shape[1]
+    acc = np.empty((CHUNK_FRAMES, channels), dtype=np.float32)
+    for start in range(0, frames, CHUNK_FRAMES):
+        end = min(start + CHUNK_FRAMES, frames)
+        out = acc[:end - start]
+        out.fill(0)
+        for data, gain in stems:
+            # int16 -> float, scaled in one step per stem
+            out += data[start:end] * np.float32(gain / 32768)
+        yield wavfile.to_pcm16(out)
+
+
+def wav_stream(stems, sample_rate: int):
+    frames = min(len(data) for data, _ in stems)
+    yield wavfile.header(stems[0][0].shape[1], sample_rate, frames)
+    yield from mix_pcm(stems)
+
+
+def ffmpeg_stream(stems, sample_rate: int, output_args):
+    """Encode the mix with ffmpeg, feeding PCM in and reading the encoded bytes out."""
+    channels = stems[0][0].shape[1]
+    process = subprocess.Popen(
+        ["ffmpeg", "-v", "error", "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels),
+         "-i", "pipe:0", *output_args, "pipe:1"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+
+    def feed():
+        try:
+            for block in mix_pcm(stems):
+                process.stdin.write(block)
+        except (BrokenPipeError, ValueError):
+            # The reader went away; the generator below is cleaning up
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    feeder = threading.Thread(target=feed, name="remix-encoder", daemon=True)
+    feeder.start()
+    try:
+        while True:
+            block = process.stdout.read(1 << 16)
+            if not block:
+                break
+            yield block
+        # Only reached when ffmpeg closed its output on its own
+        if process.wait() != 0:
+            logger.error(f"ffmpeg exited with code {process.returncode} while encoding a remix")
+            raise RuntimeError(f"ffmpeg exited with code {process.returncode}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        feeder.join()
+
+
+def render(stem_paths: dict, gains: dict, fmt: str):
+    """
+    Stream the mix of `stem_paths` (stem -> WAV path) with `gains` (stem ->
+    dB, None to mute; missing stems play at 0 dB) encoded as `fmt`.
+    """
+    stems = []
+    sample_rate = None
+    for stem, path in stem_paths.items():
+        gain = db_to_gain(gains.get(stem, 0.0))
+        if gain == 0.0:
+            continue
+        data, rate = open_stem(path)
+        if sample_rate not in (None, rate) or (stems and data.shape[1] != stems[0][0].shape[1]):
+            raise ValueError(f"Stem {stem} does not match the other stems' format")
+        sample_rate = rate
+        stems.append((data, gain))
+    if not stems:
+        raise ValueError("Every stem is muted")
+
+    output_args = FORMATS[fmt][1]
+    if output_args is None:
+        return wav_stream(stems, sample_rate)
+    return ffmpeg_stream(stems, sample_rate, output_args)
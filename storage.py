@@ -0,0 +1,13 @@
+import os
+import pathlib
+
+# Paths. Point SHARED_DIR (or OUTPUT_BASE / UPLOAD_DIR individually) at a
+# volume mounted on every node to run several API replicas and workers.
+HOME_DIR = pathlib.Path(__file__).parent.resolve()
+SHARED_DIR = pathlib.Path(os.environ.get("SHARED_DIR", str(HOME_DIR)))
+OUTPUT_BASE = pathlib.Path(os.environ.get("OUTPUT_BASE", str(SHARED_DIR / "output")))
+UPLOAD_DIR = pathlib.Path(os.environ.get("UPLOAD_DIR", str(SHARED_DIR)))
+
+# Ensure the shared directories exist before anything mounts or writes to them
+os.makedirs(OUTPUT_BASE, exist_ok=True)
+os.makedirs(UPLOAD_DIR, exist_ok=True)
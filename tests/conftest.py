@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# storage and checkpoint create their directories on import; keep them out
+# of the checkout
+os.environ.setdefault("SHARED_DIR", tempfile.mkdtemp(prefix="api_sound_tests_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,162 @@
+import sys
+import types
+import wave
+
+import numpy as np
+import pytest
+
+import checkpoint
+import jobs
+import models
+import wavfile
+
+SEGMENT = 16384
+CONTEXT = 1024
+# Two and a half segments, so the last one is short
+AUDIO = np.random.default_rng(0).uniform(-0.5, 0.5, (SEGMENT * 5 // 2 + 100, 2)).astype(np.float32)
+JOB = {"file_path": "/uploads/song.mp3", "model": "spleeter:2stems", "sort_key": 1.0}
+
+
+def fake_separate(waveform):
+    """Spleeter stand-in whose output depends on neighbouring samples."""
+    kernel = np.ones(65, dtype=np.float32) / 65
+    vocals = np.stack(
+        [np.convolve(waveform[:, c], kernel, mode="same") for c in range(waveform.shape[1])], axis=1
+    )
+    return {"vocals": vocals, "accompaniment": waveform - vocals}
+
+
+class FakeSeparator:
+    # Separations after which to raise, counted from the first real segment
+    crash_at = None
+    calls = 0
+
+    def __init__(self, model):
+        pass
+
+    def separate(self, waveform):
+        if waveform.any():
+            FakeSeparator.calls += 1
+            if FakeSeparator.calls == FakeSeparator.crash_at:
+                raise RuntimeError("worker killed")
+        return fake_separate(waveform)
+
+
+class FakeAudioAdapter:
+    @staticmethod
+    def default():
+        return FakeAudioAdapter()
+
+    def load(self, path, offset=0, duration=None, sample_rate=None):
+        start = int(round(offset * sample_rate))
+        end = len(AUDIO) if duration is None else start + int(round(duration * sample_rate))
+        return AUDIO[start:end], sample_rate
+
+
+@pytest.fixture(autouse=True)
+def fake_spleeter(monkeypatch, tmp_path):
+    separator = types.ModuleType("spleeter.separator")
+    separator.Separator = FakeSeparator
+    adapter = types.ModuleType("spleeter.audio.adapter")
+    adapter.AudioAdapter = FakeAudioAdapter
+    for name, module in [
+        ("spleeter", types.ModuleType("spleeter")),
+        ("spleeter.separator", separator),
+        ("spleeter.audio", types.ModuleType("spleeter.audio")),
+        ("spleeter.audio.adapter", adapter),
+    ]:
+        monkeypatch.setitem(sys.modules, name, module)
+    monkeypatch.setattr(models, "_models", {})
+    monkeypatch.setattr(FakeSeparator, "crash_at", None)
+    monkeypatch.setattr(FakeSeparator, "calls", 0)
+    monkeypatch.setattr(checkpoint, "SEGMENT_FRAMES", SEGMENT)
+    monkeypatch.setattr(checkpoint, "CONTEXT_FRAMES", CONTEXT)
+    monkeypatch.setattr(checkpoint, "CHECKPOINT_DIR", tmp_path / "checkpoints")
+    monkeypatch.setattr(checkpoint, "OUTPUT_BASE", tmp_path / "output")
+    (tmp_path / "checkpoints").mkdir()
+
+
+def read_stem(name):
+    with wave.open(str(checkpoint.OUTPUT_BASE / "song" / f"{name}.wav")) as w:
+        return np.frombuffer(w.readframes(w.getnframes()), dtype="<i2").reshape(-1, 2)
+
+
+def expected_stem(name):
+    """What separating the whole track in one call gives."""
+    pcm = wavfile.to_pcm16(fake_separate(AUDIO)[name])
+    return np.frombuffer(pcm, dtype="<i2").reshape(-1, 2)
+
+
+def assert_within_one_lsb(got, expected):
+    assert got.shape == expected.shape
+    assert np.abs(got.astype(np.int32) - expected).max() <= 1
+
+
+def test_stitched_segments_match_whole_track():
+    checkpoint.save_job("t1", JOB)
+    result = checkpoint.separate_resumable("t1", JOB, "w1")
+
+    assert result["downloads"] == {"vocals": "song/vocals.wav", "accompaniment": "song/accompaniment.wav"}
+    assert checkpoint.load_progress("t1")["segments"] == 3
+    for stem in ("vocals", "accompaniment"):
+        assert_within_one_lsb(read_stem(stem), expected_stem(stem))
+
+
+def test_segments_without_context_show_seams(monkeypatch):
+    monkeypatch.setattr(checkpoint, "CONTEXT_FRAMES", 0)
+    checkpoint.save_job("t1", JOB)
+    checkpoint.separate_resumable("t1", JOB, "w1")
+
+    diff = np.abs(read_stem("vocals").astype(np.int32) - expected_stem("vocals")).max(axis=1)
+    assert diff[SEGMENT - 1] > 1 and diff[SEGMENT] > 1
+
+
+def test_resume_truncates_partial_segment():
+    checkpoint.save_job("t1", JOB)
+    FakeSeparator.crash_at = 2
+    with pytest.raises(RuntimeError):
+        checkpoint.separate_resumable("t1", JOB, "w1")
+    assert checkpoint.load_progress("t1")["frames"] == SEGMENT
+
+    # Half a segment written before the crash was recorded
+    for stem in ("vocals", "accompaniment"):
+        with open(checkpoint.job_dir("t1") / f"{stem}.wav", "ab") as f:
+            f.write(b"\x7f" * 1000)
+        with open(checkpoint.job_dir("t1") / f"{stem}.256.dat", "ab") as f:
+            f.write(b"\x7f" * 10)
+
+    FakeSeparator.crash_at = None
+    result = checkpoint.separate_resumable("t1", JOB, "w2")
+
+    assert checkpoint.load_progress("t1")["segments"] == 3
+    for stem in ("vocals", "accompaniment"):
+        assert_within_one_lsb(read_stem(stem), expected_stem(stem))
+    name = result["waveforms"]["vocals"]["peaks"]["256"]
+    dat = checkpoint.peaks.dat_to_json(str(checkpoint.peaks_dir("song") / name))
+    assert dat["length"] == -(-len(AUDIO) // 256)
+
+
+def test_resume_scan_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(checkpoint, "MAX_ATTEMPTS", 2)
+    store = jobs.MemoryJobStore()
+    checkpoint.save_job("t1", JOB)
+
+    def owner_exits():
+        progress = checkpoint.load_progress("t1")
+        progress["owner"] = dict(progress["owner"], started="gone")
+        checkpoint._write_json(checkpoint.job_dir("t1") / "progress.json", progress)
+
+    # A live owner keeps the job
+    checkpoint.resume_unfinished(store, "w1")
+    assert store.get_status("t1") is None
+
+    for attempt in (1, 2):
+        owner_exits()
+        checkpoint.resume_unfinished(store, "w1")
+        assert store.get_status("t1")["stage"] == "queued"
+        assert checkpoint.load_progress("t1")["attempts"] == attempt
+
+    owner_exits()
+    checkpoint.resume_unfinished(store, "w1")
+    assert store.get_status("t1")["status"] == "error"
+    assert not checkpoint.job_dir("t1").exists()
@@ -0,0 +1,53 @@
+import pytest
+
+import jobs
+import scheduler
+
+
+def queued(duration, priority):
+    job = {"file_path": "unused", "model": "spleeter:2stems", "outputs": ["vocals", "accompaniment"],
+           "priority": priority, "duration": duration}
+    return scheduler.schedule(job, 0)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return jobs.MemoryJobStore()
+    return jobs.SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_claims_in_sort_key_order(store):
+    for task_id, duration, priority in [
+        ("long", 1000, "normal"),
+        ("hi", 1200, "high"),
+        ("low", 10, "low"),
+        ("short", 10, "normal"),
+    ]:
+        store.enqueue(task_id, queued(duration, priority))
+
+    order = [store.claim("w1", timeout=0)[0] for _ in range(4)]
+    assert order == ["short", "low", "hi", "long"]
+    assert store.claim("w1", timeout=0) is None
+
+
+def test_claim_marks_job_running(store):
+    job = queued(10, "normal")
+    store.enqueue("t1", job)
+    assert store.get_status("t1") == {"status": "processing", "stage": "queued"}
+
+    task_id, claimed = store.claim("w1", timeout=0)
+    assert (task_id, claimed) == ("t1", job)
+    assert store.get_status("t1") == {"status": "processing", "stage": "separating", "worker": "w1"}
+
+
+def test_sqlite_claims_each_job_once(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    first, second = jobs.SQLiteJobStore(path), jobs.SQLiteJobStore(path)
+    first.enqueue("t1", queued(10, "normal"))
+
+    assert first.claim("w1", timeout=0)[0] == "t1"
+    assert second.claim("w2", timeout=0) is None
+
+    second.set_status("t1", {"status": "completed"})
+    assert first.get_status("t1") == {"status": "completed"}
@@ -0,0 +1,33 @@
+import numpy as np
+
+import peaks
+
+
+def test_compute_peaks_shorter_than_one_block():
+    data = np.array([[0.5, -0.25], [-1.0, 0.75]], dtype=np.float32)
+    result = peaks.compute_peaks(data, 256)
+    assert result.tolist() == [[-127, 95]]
+
+
+def test_compute_peaks_empty():
+    assert peaks.compute_peaks(np.zeros((0, 2), dtype=np.float32), 256).shape == (0, 2)
+
+
+def test_short_final_segment(tmp_path):
+    rng = np.random.default_rng(0)
+    level = max(peaks.PEAK_LEVELS)
+    data = rng.uniform(-1, 1, (level * 3 + 10, 2)).astype(np.float32)
+    # A whole segment followed by a final segment shorter than any block
+    split = level * 3
+
+    writer = peaks.PeakWriter(tmp_path, "vocals", 0, 44100)
+    writer.append(data[:split])
+    writer.append(data[split:])
+    writer.close()
+    written = writer.publish(tmp_path / "out")
+
+    for level in peaks.PEAK_LEVELS:
+        dat = peaks.dat_to_json(str(tmp_path / "out" / written["peaks"][str(level)]))
+        expected = peaks.compute_peaks(data, level)
+        assert dat["length"] == len(expected) == -(-len(data) // level)
+        assert dat["data"] == expected.ravel().tolist()
@@ -0,0 +1,34 @@
+import scheduler
+
+
+def key(duration, priority="normal", enqueued_at=0.0, model="spleeter:2stems"):
+    job = {"file_path": "unused", "model": model, "outputs": ["vocals"], "priority": priority,
+           "duration": duration}
+    return scheduler.schedule(job, enqueued_at)["sort_key"]
+
+
+def test_shorter_job_first():
+    assert key(60) < key(300)
+
+
+def test_bigger_model_costs_more():
+    assert key(60, model="spleeter:2stems") < key(60, model="spleeter:5stems")
+
+
+def test_priority_outweighs_length():
+    assert key(600, "high") < key(60, "normal") < key(60, "low")
+
+
+def test_waiting_long_job_overtakes_new_short_job():
+    long_cost = key(600) - key(60)
+    waited = long_cost / scheduler.AGING_RATE
+    assert key(600, enqueued_at=0) > key(60, enqueued_at=waited - 1)
+    assert key(600, enqueued_at=0) < key(60, enqueued_at=waited + 1)
+
+
+def test_schedule_probes_when_duration_unknown(monkeypatch):
+    monkeypatch.setattr(scheduler, "probe_duration", lambda path: None)
+    job = scheduler.schedule({"file_path": "x", "model": "spleeter:2stems", "outputs": ["vocals"]}, 0)
+    assert job["duration"] == scheduler.DEFAULT_DURATION
+    assert job["estimated_cost"] == round(scheduler.estimate_cost(scheduler.DEFAULT_DURATION,
+                                                                  "spleeter:2stems", ["vocals"]), 2)
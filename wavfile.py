@@ -0,0 +1,44 @@
+import struct
+
+import numpy as np
+
+# Size of the canonical PCM header written by `header`
+HEADER_SIZE = 44
+SAMPLE_WIDTH = 2
+
+
+def header(channels: int, sample_rate: int, frames: int) -> bytes:
+    """Canonical 16-bit PCM WAV header for `frames` frames."""
+    block_align = channels * SAMPLE_WIDTH
+    data_size = frames * block_align
+    return (
+        b"RIFF"
+        + struct.pack("<I", 36 + data_size)
+        + b"WAVEfmt "
+        + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, sample_rate * block_align,
+                      block_align, SAMPLE_WIDTH * 8)
+        + b"data"
+        + struct.pack("<I", data_size)
+    )
+
+
+def to_pcm16(data) -> bytes:
+    """Interleaved 16-bit PCM bytes for a float (frames, channels) array."""
+    return (np.clip(data, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def finalize(path: str, channels: int, sample_rate: int) -> int:
+    """Rewrite the header of a WAV whose PCM was appended after a placeholder header."""
+    with open(path, "r+b") as f:
+        f.seek(0, 2)
+        frames = (f.tell() - HEADER_SIZE) // (channels * SAMPLE_WIDTH)
+        f.seek(0)
+        f.write(header(channels, sample_rate, frames))
+    return frames
+
+
+def write(path: str, data, sample_rate: int):
+    """Write a float (frames, channels) array as a 16-bit PCM WAV."""
+    with open(path, "wb") as f:
+        f.write(header(data.shape[1], sample_rate, len(data)))
+        f.write(to_pcm16(data))
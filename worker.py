@@ -0,0 +1,107 @@
+"""
+Stateless separation worker.
+
+Pulls jobs from the shared job store, writes stems under OUTPUT_BASE and
+records the result in the store, so any API replica can report status and
+serve downloads. Progress is checkpointed per segment (see checkpoint.py). Run standalone on any node:
+
+    JOB_BACKEND=redis SHARED_DIR=/mnt/shared python worker.py --concurrency 1
+
+The API also runs EMBEDDED_WORKERS of these loops in-process.
+"""
+import os
+import socket
+import logging
+import argparse
+import threading
+
+import models
+import checkpoint
+from cpu_tuning import apply_cpu_config
+from jobs import POLL_INTERVAL, get_job_store
+
+logger = logging.getLogger(__name__)
+
+
+def process_job(task_id: str, job: dict, worker_id: str) -> dict:
+    """Run Spleeter with segment checkpoints, then clean up the upload."""
+    result = checkpoint.separate_resumable(task_id, job, worker_id)
+
+    # Clean up original upload
+    file_path = job["file_path"]
+    try:
+        os.remove(file_path)
+        logger.info(f"Removed upload: {file_path}")
+    except Exception as e:
+        logger.error(f"Cleanup error for {file_path}: {e}")
+
+    return result
+
+
+def run_worker(worker_id: str, stop_event: threading.Event = None):
+    """Claim and process jobs until `stop_event` is set."""
+    store = get_job_store()
+    stop_event = stop_event or threading.Event()
+    logger.info(f"Worker {worker_id} started")
+    while not stop_event.is_set():
+        try:
+            claimed = store.claim(worker_id)
+        except Exception as e:
+            # Store unreachable or locked; keep the loop alive and try again
+            logger.error(f"Worker {worker_id} could not claim a job: {e}")
+            stop_event.wait(POLL_INTERVAL)
+            continue
+        if claimed is None:
+            continue
+        task_id, job = claimed
+        try:
+            store.set_status(task_id, process_job(task_id, job, worker_id))
+            logger.info(f"Task {task_id} completed")
+        except checkpoint.TaskLocked:
+            # A duplicate claim; the process holding the lock reports the result
+            logger.warning(f"Task {task_id} is already being processed elsewhere, skipping")
+            continue
+        except Exception as e:
+            logger.exception(f"Background processing failed ({task_id}): {e}")
+            store.set_status(task_id, {"status": "error", "message": str(e)})
+        checkpoint.cleanup(task_id)
+
+
+def worker_id(index: int = 0) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+def start_workers(count: int, stop_event: threading.Event = None):
+    """Start `count` worker loops in daemon threads."""
+    threads = []
+    for i in range(count):
+        thread = threading.Thread(
+            target=run_worker,
+            args=(worker_id(i), stop_event),
+            name=f"separation-worker-{i}",
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run separation workers against the shared job queue.")
+    parser.add_argument("--concurrency", type=int, default=1, help="worker loops in this process")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = get_job_store()
+    if not store.shared:
+        parser.error("the memory job store lives inside the API process; "
+                     "standalone workers need JOB_BACKEND=sqlite or redis")
+    apply_cpu_config()
+    models.start_preload()
+    checkpoint.start_resumer(store, worker_id())
+    for thread in start_workers(args.concurrency):
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()